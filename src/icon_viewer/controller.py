@@ -1,6 +1,6 @@
 from __future__ import annotations
-from dataclasses import dataclass, field
-from typing import List, Optional
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
 
 from .models import IconImage
 from .service import IconService
@@ -9,7 +9,7 @@ from .service import IconService
 @dataclass
 class IconViewerController:
     service: IconService
-    images: List[IconImage] = field(default_factory=list)
+    images: Tuple[IconImage, ...] = ()
     selected_index: Optional[int] = None
     current_file: Optional[str] = None
 
@@ -39,6 +39,10 @@ class IconViewerController:
         sel = self.get_selected()
         return sel.png_bytes if sel else None
 
+    def get_selected_b64(self) -> Optional[str]:
+        sel = self.get_selected()
+        return sel.b64 if sel else None
+
     def get_selected_label(self) -> Optional[str]:
         sel = self.get_selected()
         return sel.label if sel else None
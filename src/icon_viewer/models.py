@@ -1,5 +1,6 @@
 from __future__ import annotations
-from dataclasses import dataclass
+import base64
+from dataclasses import dataclass, field
 from typing import Tuple
 
 
@@ -8,8 +9,16 @@ class IconImage:
     """Represents a single embedded image from a .ico file."""
     width: int
     height: int
-    size_bytes: int
     png_bytes: bytes
+    # Base64 of `png_bytes`, derived once at construction for display
+    b64: str = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        object.__setattr__(self, "b64", base64.b64encode(self.png_bytes).decode("ascii"))
+
+    @property
+    def size_bytes(self) -> int:
+        return len(self.png_bytes)
 
     @property
     def size(self) -> Tuple[int, int]:
@@ -1,12 +1,29 @@
 from __future__ import annotations
+import hashlib
+import os
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
+from functools import lru_cache
 from io import BytesIO
 from pathlib import Path
-from typing import List, Dict, Tuple
-from PIL import Image
+from typing import ClassVar, List, Dict, Tuple
+from PIL import Image, UnidentifiedImageError
 
 from .models import IconImage
 
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# Number of decoded icons kept by each of IconService's caches
+_CACHE_SIZE = 32
+
+# Pillow 10+: Image.Resampling.LANCZOS; older: Image.LANCZOS
+try:
+    _RESAMPLE_LANCZOS = Image.Resampling.LANCZOS  # type: ignore[attr-defined]
+except AttributeError:
+    _RESAMPLE_LANCZOS = Image.LANCZOS  # type: ignore[attr-defined]
+
 
 @dataclass
 class IconService:
@@ -18,65 +35,218 @@ class IconService:
     - Use `im.info.get("sizes")` if present to know target sizes embedded in the ICO.
     - If some sizes are missing as frames (common in some builds), synthesize them by
       resizing the largest available frame with high-quality resampling.
+
+    Decoded icons are cached: by (path, mtime, size) so re-opening an unchanged file
+    is a lookup, and by content digest so copies of the same icon share one entry.
     """
 
-    def load_icon(self, file_path: str) -> List[IconImage]:
-        with Image.open(file_path) as im:
+    _icons_by_digest: ClassVar[Dict[bytes, Tuple[IconImage, ...]]] = {}
+    # Flet runs event handlers on worker threads, so opens can overlap
+    _icons_lock: ClassVar[threading.Lock] = threading.Lock()
+
+    def load_icon(self, file_path: str | os.PathLike) -> Tuple[IconImage, ...]:
+        # Normalise so str and Path spellings of a file share one cache entry
+        file_path = os.fspath(file_path)
+        st = os.stat(file_path)
+        # Icons are immutable, so the cached tuple is handed out as-is
+        return IconService._load_icon_cached(file_path, st.st_mtime_ns, st.st_size)
+
+    @staticmethod
+    @lru_cache(maxsize=_CACHE_SIZE)
+    def _load_icon_cached(file_path: str, mtime_ns: int, size: int) -> Tuple[IconImage, ...]:
+        # mtime_ns and size are only part of the cache key, so edits to the file miss
+        with open(file_path, "rb") as f:
+            data = f.read()
+        digest = hashlib.sha1(data).digest()
+        with IconService._icons_lock:
+            images = IconService._icons_by_digest.get(digest)
+        if images is not None:
+            return images
+        # Decode outside the lock; a concurrent open of the same icon at worst decodes twice
+        images = IconService._decode_icon(data, file_path)
+        with IconService._icons_lock:
+            images = IconService._icons_by_digest.setdefault(digest, images)
+            if len(IconService._icons_by_digest) > _CACHE_SIZE:
+                # Evict the oldest entry (dicts keep insertion order)
+                del IconService._icons_by_digest[next(iter(IconService._icons_by_digest))]
+        return images
+
+    @classmethod
+    def clear_cache(cls) -> None:
+        """Drop all cached icons."""
+        cls._load_icon_cached.cache_clear()
+        with cls._icons_lock:
+            cls._icons_by_digest.clear()
+
+    @staticmethod
+    def _decode_icon(data: bytes, file_path: str) -> Tuple[IconImage, ...]:
+        try:
+            im = Image.open(BytesIO(data))
+        except UnidentifiedImageError as ex:
+            # Pillow only sees the in-memory buffer; name the file like the baseline did
+            raise UnidentifiedImageError("Cannot identify image file: " + file_path) from ex
+        with im:
             if im.format != "ICO":
                 raise ValueError("Provided file is not an ICO: " + file_path)
 
-            # Collect actual frames if available
-            frames_by_size: Dict[Tuple[int, int], Image.Image] = {}
-            largest_frame: Image.Image | None = None
-
             try:
                 frame_count = getattr(im, "n_frames", 1)
             except Exception:
                 frame_count = 1
 
+            declared_sizes = im.info.get("sizes")
+
+            # First pass: record which frame holds each size, keyed by packed size,
+            # without copying any pixel data
+            frame_index_by_key: Dict[int, int] = {}
+            largest_key: int | None = None
+            largest_area = 0
+
             for i in range(max(1, frame_count)):
                 try:
                     im.seek(i)
                 except EOFError:
                     break
-                fr = im.copy().convert("RGBA")
-                frames_by_size[fr.size] = fr
-                if (largest_frame is None) or (fr.size[0] * fr.size[1] > largest_frame.size[0] * largest_frame.size[1]):
-                    largest_frame = fr
+                w, h = im.size
+                key = IconService._size_key(w, h)
+                frame_index_by_key[key] = i
+                if (largest_key is None) or (w * h > largest_area):
+                    largest_key, largest_area = key, w * h
 
-            if largest_frame is None:
+            if largest_key is None:
                 # Fallback to current image
-                largest_frame = im.copy().convert("RGBA")
-                frames_by_size[largest_frame.size] = largest_frame
+                w, h = im.size
+                largest_key = IconService._size_key(w, h)
+                frame_index_by_key[largest_key] = im.tell()
 
-            # Determine target sizes: use ICO declared sizes if present; otherwise use collected sizes
-            target_sizes = im.info.get("sizes") or list(frames_by_size.keys())
-            # Deduplicate and sort ascending
-            target_sizes = sorted(set(target_sizes), key=lambda s: (s[0] * s[1], s[0], s[1]))
+            # Determine target sizes: use ICO declared sizes if present; otherwise use collected sizes.
+            # Packed keys dedupe, and sorting them orders by (width, height) in the same pass
+            if declared_sizes:
+                seen = {IconService._size_key(w, h): (w, h) for w, h in declared_sizes}
+            else:
+                seen = {k: IconService._size_from_key(k) for k in frame_index_by_key}
+            target_sizes = [seen[k] for k in sorted(seen)]
+
+            # Prepare PNG bytes per size: copy PNG-encoded entries straight out of the file,
+            # otherwise encode the real frame when available, or resize the largest
+            embedded_pngs = IconService._embedded_pngs(data)
+            missing = [
+                size for size in target_sizes
+                if size not in embedded_pngs and IconService._size_key(*size) not in frame_index_by_key
+            ]
+
+            # Second pass: copy only the frames that will be encoded, plus the largest if
+            # missing sizes must be synthesized from it
+            needed_keys = {
+                IconService._size_key(*size) for size in target_sizes if size not in embedded_pngs
+            }.intersection(frame_index_by_key)
+            if missing:
+                needed_keys.add(largest_key)
+            frame_by_key: Dict[int, Image.Image] = {}
+            for key in sorted(needed_keys, key=frame_index_by_key.__getitem__):
+                im.seek(frame_index_by_key[key])
+                # Defer RGBA conversion until a frame is actually emitted or resized
+                frame_by_key[key] = im.copy()
 
-            # Prepare PNG bytes per size, using real frame when available, otherwise resize largest
             images: List[IconImage] = []
 
-            # Pillow 10+: Image.Resampling.LANCZOS; older: Image.LANCZOS
-            try:
-                resample = Image.Resampling.LANCZOS  # type: ignore[attr-defined]
-            except Exception:
-                resample = Image.LANCZOS  # type: ignore[attr-defined]
+            # Synthesize missing sizes from the largest frame in one descending chain
+            synthesized = IconService._synthesize(frame_by_key[largest_key], missing) if missing else {}
 
+            to_encode: List[Tuple[Tuple[int, int], Image.Image]] = []
             for size in target_sizes:
-                if size in frames_by_size:
-                    out_img = frames_by_size[size]
-                else:
-                    # Synthesize from largest frame
-                    out_img = largest_frame.resize(size, resample=resample)
-                buf = BytesIO()
-                out_img.save(buf, format="PNG")
-                data = buf.getvalue()
-                images.append(IconImage(width=size[0], height=size[1], size_bytes=len(data), png_bytes=data))
+                png = embedded_pngs.get(size)
+                if png is not None:
+                    images.append(IconImage(width=size[0], height=size[1], png_bytes=png))
+                    continue
+                frame = frame_by_key.get(IconService._size_key(*size))
+                to_encode.append((size, frame if frame is not None else synthesized[size]))
+
+            # Pillow releases the GIL while encoding, so frames encode concurrently
+            if len(to_encode) > 1:
+                with ThreadPoolExecutor(max_workers=min(8, len(to_encode))) as ex:
+                    encoded = list(ex.map(IconService._encode_png, to_encode))
+            else:
+                encoded = [IconService._encode_png(task) for task in to_encode]
+            for size, png in encoded:
+                images.append(IconImage(width=size[0], height=size[1], png_bytes=png))
 
             # Ensure final sort from smallest to largest
-            images.sort(key=lambda ii: (ii.width * ii.height, ii.width, ii.height))
-            return images
+            return tuple(sorted(images, key=lambda ii: (ii.width * ii.height, ii.width, ii.height)))
+
+    @staticmethod
+    def _synthesize(source: Image.Image, sizes: List[Tuple[int, int]]) -> Dict[Tuple[int, int], Image.Image]:
+        """Downscale `source` to each of `sizes`, largest first.
+
+        Each step starts from the previous result rather than the full-size source, and
+        exact integer factors use `reduce` (a cheap box filter) instead of a resample.
+        """
+        base = source if source.mode == "RGBA" else source.convert("RGBA")
+        cur = base
+        out: Dict[Tuple[int, int], Image.Image] = {}
+        for size in sorted(sizes, key=lambda s: (s[0] * s[1], s[0], s[1]), reverse=True):
+            if cur.size[0] < size[0] or cur.size[1] < size[1]:
+                # Never upscale a previous step; go back to the original
+                cur = base
+            if cur.size != size:
+                src, factor = cur, IconService._reduce_factor(cur.size, size)
+                if not factor:
+                    # An exact factor of the original beats resampling the previous step
+                    src, factor = base, IconService._reduce_factor(base.size, size)
+                cur = src.reduce(factor) if factor else cur.resize(size, resample=_RESAMPLE_LANCZOS)
+            out[size] = cur
+        return out
+
+    @staticmethod
+    def _size_key(w: int, h: int) -> int:
+        """Pack a size into one int; ICO sizes are at most 256, so this cannot collide."""
+        return (w << 16) | h
+
+    @staticmethod
+    def _size_from_key(key: int) -> Tuple[int, int]:
+        return (key >> 16, key & 0xFFFF)
+
+    @staticmethod
+    def _reduce_factor(src_size: Tuple[int, int], size: Tuple[int, int]) -> int:
+        """Return k > 1 if `src_size` is exactly `size` scaled by k, else 0."""
+        k = src_size[0] // size[0]
+        return k if k > 1 and src_size == (size[0] * k, size[1] * k) else 0
+
+    @staticmethod
+    def _encode_png(task: Tuple[Tuple[int, int], Image.Image]) -> Tuple[Tuple[int, int], bytes]:
+        size, img = task
+        if img.mode != "RGBA":
+            img = img.convert("RGBA")
+        # Bytes are only rendered in memory, so favour encode speed over size
+        with BytesIO() as buf:
+            img.save(buf, format="PNG", compress_level=1, optimize=False)
+            return size, buf.getvalue()
+
+    @staticmethod
+    def _embedded_pngs(data: bytes) -> Dict[Tuple[int, int], bytes]:
+        """Map each size whose best ICO directory entry is stored as PNG to its raw bytes.
+
+        The best entry per size is the one with the highest bit depth; sizes whose best
+        entry is a BMP (DIB) frame, or whose PNG header disagrees with the directory,
+        are left out so they go through Pillow.
+        """
+        best: Dict[Tuple[int, int], Tuple[int, bytes | None]] = {}
+        (count,) = struct.unpack_from("<H", data, 4)
+        for i in range(count):
+            entry_offset = 6 + 16 * i
+            if entry_offset + 16 > len(data):
+                break
+            w, h, _, _, _, bpp, length, offset = struct.unpack_from("<BBBBHHII", data, entry_offset)
+            size = (w or 256, h or 256)
+            png = None
+            if data[offset:offset + 8] == _PNG_SIGNATURE:
+                payload = data[offset:offset + length]
+                # IHDR width/height follow the signature and chunk header
+                if len(payload) >= 24 and struct.unpack_from(">II", payload, 16) == size:
+                    png = payload
+            if size not in best or bpp >= best[size][0]:
+                best[size] = (bpp, png)
+        return {size: png for size, (_, png) in best.items() if png is not None}
 
     # --- Export API ---
     def save_image_bytes(self, data: bytes, out_path: str, *, jpg_bg=(255, 255, 255), quality: int = 95) -> None:
@@ -95,14 +265,19 @@ class IconService:
             return
         if ext in (".jpg", ".jpeg"):
             with Image.open(BytesIO(data)) as im:
-                im = im.convert("RGBA")
-                bg = Image.new("RGB", im.size, tuple(jpg_bg))
-                # Paste with alpha channel as mask if present
-                alpha = im.getchannel("A") if "A" in im.getbands() else None
-                bg.paste(im, mask=alpha)
-                buf = BytesIO()
-                bg.save(buf, format="JPEG", quality=int(quality))
+                if im.mode != "RGBA":
+                    im = im.convert("RGBA")
+                alpha_min, _ = im.getextrema()[3]
+                if alpha_min == 255:
+                    # Fully opaque: nothing to composite
+                    bg = im.convert("RGB")
+                else:
+                    bg = Image.new("RGB", im.size, tuple(jpg_bg))
+                    # Paste with alpha channel as mask
+                    bg.paste(im, mask=im.getchannel("A"))
+                # Encode straight into the output file, no intermediate buffer
                 with open(out_path, "wb") as f:
-                    f.write(buf.getvalue())
+                    # Fixed fast settings: no Huffman optimisation pass, baseline, 4:2:0 chroma
+                    bg.save(f, format="JPEG", quality=int(quality), optimize=False, progressive=False, subsampling=2)
             return
         raise ValueError(f"Unsupported export extension: {ext}. Use .png, .jpg or .jpeg")
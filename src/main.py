@@ -1,4 +1,3 @@
-import base64
 import flet as ft
 from pathlib import Path
 from typing import Optional
@@ -77,7 +76,8 @@ def main(page: ft.Page):
         data = controller.get_selected_png_bytes()
         has_image = bool(data)
         if has_image:
-            image.src_base64 = base64.b64encode(data).decode("ascii")
+            # Base64 is computed once per image at load time, not per click
+            image.src_base64 = controller.get_selected_b64()
             image.visible = True
             status_text.visible = False
         else:
@@ -91,22 +91,31 @@ def main(page: ft.Page):
         image.update()
         status_text.update()
 
+    def on_tile_click(e: ft.ControlEvent):
+        prev = controller.selected_index
+        controller.select_index(e.control.data)
+        # Only the previously and newly selected tiles change
+        if prev is not None and prev != e.control.data:
+            prev_tile = list_view.controls[prev]
+            prev_tile.selected = False
+            prev_tile.update()
+        e.control.selected = True
+        e.control.update()
+        update_image_from_selection()
+
     def rebuild_list():
-        list_view.controls.clear()
-        for idx, label in enumerate(controller.get_labels()):
-            def on_tap_factory(i: int):
-                def _tap(_: ft.ControlEvent):
-                    controller.select_index(i)
-                    update_image_from_selection()
-                return _tap
-
-            tile = ft.ListTile(
+        # Build all tiles in one go; the tile index travels in `data`, so one handler serves every tile
+        selected = controller.selected_index
+        list_view.controls = [
+            ft.ListTile(
                 title=ft.Text(label),
-                on_click=on_tap_factory(idx),
-                selected=(idx == (controller.selected_index or -1)),
+                on_click=on_tile_click,
+                data=idx,
+                selected=(idx == selected),
                 dense=True,
             )
-            list_view.controls.append(tile)
+            for idx, label in enumerate(controller.get_labels())
+        ]
         list_view.update()
 
     def open_icon(file_path: str):
@@ -1,8 +1,32 @@
 import sys
 from pathlib import Path
 
+import pytest
+
 # Ensure 'src' is on sys.path for imports in tests
 ROOT = Path(__file__).resolve().parents[1]
 src_path = ROOT / "src"
 if str(src_path) not in sys.path:
     sys.path.insert(0, str(src_path))
+
+from PIL import Image  # noqa: E402
+
+from icon_viewer.service import IconService  # noqa: E402
+
+# Register all Pillow format plugins (ICO, PNG, ...) once up front, so the first
+# open/save in whichever test runs first doesn't pay for plugin discovery
+Image.init()
+
+
+@pytest.fixture(scope="session")
+def svc():
+    # One service per test process (each pytest-xdist worker builds its own). Instances
+    # hold no state, and the class-level caches are reset before every test below
+    return IconService()
+
+
+@pytest.fixture(autouse=True)
+def _clear_icon_cache():
+    # The icon caches are process-wide; start every test from a cold cache
+    IconService.clear_cache()
+    yield
@@ -1,4 +1,5 @@
 from pathlib import Path
+import base64
 import io
 from PIL import Image
 
@@ -14,10 +15,10 @@ def make_sample_ico(tmp_path: Path, sizes=((16, 16), (32, 32))):
     return ico_path
 
 
-def test_controller_open_and_select(tmp_path: Path):
+def test_controller_open_and_select(tmp_path: Path, svc: IconService):
     ico_path = make_sample_ico(tmp_path)
 
-    controller = IconViewerController(service=IconService())
+    controller = IconViewerController(service=svc)
     labels = controller.open_file(str(ico_path))
 
     # Labels are sorted from small to large, first selected
@@ -36,3 +37,14 @@ def test_controller_open_and_select(tmp_path: Path):
         assert False, "Expected IndexError"
     except IndexError:
         pass
+
+
+def test_controller_selected_b64_matches_png_bytes(tmp_path: Path, svc: IconService):
+    ico_path = make_sample_ico(tmp_path)
+    controller = IconViewerController(service=svc)
+    controller.open_file(str(ico_path))
+
+    b64 = controller.get_selected_b64()
+    assert base64.b64decode(b64) == controller.get_selected_png_bytes()
+    # Stored on the image at load time, so repeated access returns the same string object
+    assert controller.get_selected_b64() is b64
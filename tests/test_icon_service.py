@@ -1,43 +1,210 @@
 from pathlib import Path
+import base64
 import io
+import struct
+import zlib
+from functools import lru_cache
+from typing import Tuple
 import pytest
-from PIL import Image
+from PIL import Image, UnidentifiedImageError
 
 from icon_viewer.service import IconService
 
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+_ALLOWED_MODES = frozenset({"RGBA", "RGB", "P"})
 
-def make_sample_ico(tmp_path: Path, sizes=((16, 16), (32, 32), (48, 48), (64, 64))):
-    # Create base image (largest) and let Pillow embed other sizes
-    base_size = max(sizes, key=lambda s: s[0] * s[1])
-    base_img = Image.new("RGBA", base_size, (255, 0, 0, 128))
-    ico_path = tmp_path / "sample.ico"
-    base_img.save(ico_path, format="ICO", sizes=list(sizes))
+
+def png_sizes(pngs):
+    # IHDR width/height are big-endian uint32 right after the signature and chunk header;
+    # gather them for every PNG and decode all of them with a single unpack
+    short = [i for i, data in enumerate(pngs) if len(data) < 24]
+    assert not short, f"PNG payloads too short for an IHDR at indexes {short}"
+    flat = struct.unpack(f">{2 * len(pngs)}I", b"".join(data[16:24] for data in pngs))
+    return list(zip(flat[::2], flat[1::2]))
+
+
+_BASE_PIXEL = bytes((255, 0, 0, 128))
+
+
+@lru_cache(maxsize=None)
+def _solid_png(size: Tuple[int, int]) -> bytes:
+    # Minimal RGBA PNG written by hand: IHDR, one IDAT of unfiltered rows, IEND
+    w, h = size
+
+    def chunk(tag: bytes, body: bytes) -> bytes:
+        return struct.pack(">I", len(body)) + tag + body + struct.pack(">I", zlib.crc32(tag + body))
+
+    rows = (b"\x00" + _BASE_PIXEL * w) * h
+    return (
+        PNG_SIGNATURE
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", w, h, 8, 6, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(rows, 1))
+        + chunk(b"IEND", b"")
+    )
+
+
+def make_sample_ico(tmp_path: Path, sizes=((16, 16), (32, 32), (48, 48), (64, 64)), name="sample.ico"):
+    # Hand-assembled ICO with no Pillow encoding: ICONDIR, one ICONDIRENTRY per size
+    # (0 means 256), then solid PNG payloads of the exact sizes
+    pngs = [_solid_png(size) for size in sizes]
+    parts = [struct.pack("<HHH", 0, 1, len(sizes))]
+    offset = 6 + 16 * len(sizes)
+    for (w, h), png in zip(sizes, pngs):
+        parts.append(struct.pack("<BBBBHHII", w % 256, h % 256, 0, 0, 1, 32, len(png), offset))
+        offset += len(png)
+    ico_path = tmp_path / name
+    ico_path.write_bytes(b"".join(parts + pngs))
     return ico_path
 
 
-def test_load_icon_extracts_all_sizes_sorted(tmp_path: Path):
-    ico_path = make_sample_ico(tmp_path, sizes=((64, 64), (16, 16), (32, 32)))
-    svc = IconService()
+@pytest.fixture(scope="session")
+def ico_dir(tmp_path_factory):
+    # One directory for read-only icons; files inside are named uniquely per case
+    return tmp_path_factory.mktemp("icos", numbered=False)
+
+
+@pytest.fixture(scope="session")
+def sample_ico(ico_dir: Path):
+    # Built once and only ever read; tests that modify an icon make their own
+    return make_sample_ico(ico_dir)
+
 
-    images = svc.load_icon(str(ico_path))
+@pytest.mark.parametrize("input_sizes,expected", [
+    (((64, 64), (16, 16), (32, 32)), [(16, 16), (32, 32), (64, 64)]),
+    (((48, 48), (24, 24)), [(24, 24), (48, 48)]),
+])
+def test_load_icon_extracts_all_sizes_sorted(ico_dir: Path, svc: IconService, input_sizes, expected):
+    name = "sample_" + "_".join(f"{w}x{h}" for w, h in input_sizes) + ".ico"
+    ico_path = make_sample_ico(ico_dir, sizes=input_sizes, name=name)
+
+    images = svc.load_icon(ico_path)
 
     # Should be sorted from smallest to largest
-    labels = [f"{im.width}x{im.height}" for im in images]
-    assert labels == ["16x16", "32x32", "64x64"]
+    sizes_out = [(im.width, im.height) for im in images]
+    assert sizes_out == expected
+
+    # PNG bytes should be valid: signature and IHDR dimensions match each image
+    pngs = [im.png_bytes for im in images]
+    assert all(im.size_bytes == len(im.png_bytes) > 0 for im in images)
+    assert all(data.startswith(PNG_SIGNATURE) for data in pngs)
+    assert png_sizes(pngs) == expected
+
+    # Fully decode one representative image to check its mode
+    with Image.open(io.BytesIO(images[-1].png_bytes)) as opened:
+        assert opened.mode in _ALLOWED_MODES
+
+
+def test_non_ico_raises(tmp_path: Path, svc: IconService):
+    # A valid non-ICO image; a 1x1 binary PPM is readable by Pillow with no encoding step
+    ppm_path = tmp_path / "not_ico.ppm"
+    ppm_path.write_bytes(b"P6 1 1 255\n\x00\xff\x00")
+
+    with pytest.raises(ValueError, match="not an ICO"):
+        svc.load_icon(ppm_path)
+
+
+def test_unreadable_ico_error_names_file(tmp_path: Path, svc: IconService):
+    bad_path = tmp_path / "bad.ico"
+    bad_path.write_bytes(b"hello")
+
+    with pytest.raises(UnidentifiedImageError) as excinfo:
+        svc.load_icon(bad_path)
+    assert str(bad_path) in str(excinfo.value)
+
+
+def test_load_icon_reuses_cached_images(tmp_path: Path, svc: IconService):
+    ico_path = make_sample_ico(tmp_path)
+
+    first = svc.load_icon(ico_path)
+    second = svc.load_icon(ico_path)
+    assert isinstance(first, tuple)
+    assert first is second
 
-    # PNG bytes should be valid and each image should open
+    # A copy under another name hits the content-digest cache
+    copy_path = tmp_path / "copy.ico"
+    copy_path.write_bytes(ico_path.read_bytes())
+    copied = svc.load_icon(copy_path)
+    assert all(a is b for a, b in zip(first, copied))
+
+    # Rewriting the file with different content invalidates the entry
+    Image.new("RGBA", (32, 32), (0, 0, 0, 255)).save(ico_path, format="ICO", sizes=[(16, 16), (32, 32)])
+    changed = svc.load_icon(ico_path)
+    assert [im.label for im in changed] == ["16x16", "32x32"]
+
+
+def test_png_entries_are_copied_verbatim(sample_ico: Path, svc: IconService):
+    raw = sample_ico.read_bytes()
+
+    images = svc.load_icon(sample_ico)
+
+    assert [im.label for im in images] == ["16x16", "32x32", "48x48", "64x64"]
+    for im in images:
+        assert im.png_bytes in raw
+
+
+def test_bmp_entries_are_encoded_to_png(tmp_path: Path, svc: IconService):
+    ico_path = tmp_path / "bmp.ico"
+    Image.new("RGBA", (32, 32), (255, 0, 0, 128)).save(ico_path, format="ICO", sizes=[(16, 16), (32, 32)], bitmap_format="bmp")
+
+    images = svc.load_icon(ico_path)
+
+    assert [im.label for im in images] == ["16x16", "32x32"]
+    for im in images:
+        assert im.png_bytes.startswith(PNG_SIGNATURE)
+
+
+@pytest.mark.parametrize("sizes", [
+    # 48 and 24 resample the previous step; 32 and 16 reduce from the 64x64 original
+    ((16, 16), (24, 24), (32, 32), (48, 48), (64, 64)),
+    # (48, 16) is wider than the (24, 40) step before it, so the chain restarts from the original
+    ((24, 40), (48, 16), (64, 64)),
+])
+def test_bmp_sizes_are_synthesized_from_largest(tmp_path: Path, svc: IconService, sizes):
+    color = (0, 128, 255, 255)
+    base = Image.new("RGBA", (64, 64), color)
+    # Exact-size frames so Pillow stores every size, including non-square ones
+    frames = [base.resize(size) for size in sizes if size != base.size]
+    ico_path = tmp_path / "bmp_sizes.ico"
+    base.save(ico_path, format="ICO", sizes=list(sizes), append_images=frames, bitmap_format="bmp")
+
+    images = svc.load_icon(ico_path)
+
+    expected = sorted(sizes, key=lambda s: (s[0] * s[1], s[0], s[1]))
+    assert png_sizes([im.png_bytes for im in images]) == expected
     for im in images:
-        assert im.size_bytes == len(im.png_bytes) > 0
         with Image.open(io.BytesIO(im.png_bytes)) as opened:
-            assert opened.size == (im.width, im.height)
-            assert opened.mode in ("RGBA", "RGB", "P")
+            pixel = opened.convert("RGBA").getpixel((im.width // 2, im.height // 2))
+        assert all(abs(a - b) <= 2 for a, b in zip(pixel, color))
+
+def test_save_image_bytes_jpeg_composites_on_background(tmp_path: Path, svc: IconService):
+    buf = io.BytesIO()
+    Image.new("RGBA", (8, 8), (255, 0, 0, 0)).save(buf, format="PNG")
+    out_path = tmp_path / "out.jpg"
+
+    svc.save_image_bytes(buf.getvalue(), str(out_path), jpg_bg=(0, 0, 255))
+
+    with Image.open(out_path) as saved:
+        assert saved.format == "JPEG"
+        assert saved.size == (8, 8)
+        r, g, b = saved.getpixel((4, 4))
+        assert b > 200 and r < 50
 
 
-def test_non_ico_raises(tmp_path: Path):
-    # Create a PNG file and ensure service rejects it
-    png_path = tmp_path / "not_ico.png"
-    Image.new("RGBA", (32, 32), (0, 255, 0, 255)).save(png_path, format="PNG")
+def test_save_image_bytes_jpeg_opaque_ignores_background(tmp_path: Path, svc: IconService):
+    buf = io.BytesIO()
+    Image.new("RGBA", (8, 8), (255, 0, 0, 255)).save(buf, format="PNG")
+    out_path = tmp_path / "opaque.jpg"
+
+    svc.save_image_bytes(buf.getvalue(), str(out_path), jpg_bg=(0, 0, 255))
+
+    with Image.open(out_path) as saved:
+        r, g, b = saved.getpixel((4, 4))
+        assert r > 200 and b < 50
+
+
+def test_load_icon_precomputes_base64(sample_ico: Path, svc: IconService):
+    images = svc.load_icon(sample_ico)
+
+    for im in images:
+        assert base64.b64decode(im.b64) == im.png_bytes
 
-    svc = IconService()
-    with pytest.raises(ValueError):
-        svc.load_icon(str(png_path))